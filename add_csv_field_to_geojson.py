@@ -1,14 +1,29 @@
 #!/usr/bin/env python3
 
 import argparse
-import csv
-import geojson
-from unidecode import unidecode
+from collections import Counter
+from functools import partial
+import pandas as pd
 
 from general_utility import standardize_string
+from geojson_utility import rewrite_geojson_features
 
 OSM_KEY_NAME = "name"
 
+def add_attribute_to_feature(geojson_feature, attribute_key, name_to_value, name_use_counts):
+    # Properties can be null or missing in valid geojson
+    properties = geojson_feature.get('properties') or {}
+    if OSM_KEY_NAME in properties and properties[OSM_KEY_NAME] != None:
+        name = standardize_string(properties[OSM_KEY_NAME])
+        value = name_to_value.get(name)
+        if value != None:
+            properties[attribute_key] = value
+            geojson_feature['properties'] = properties
+            name_use_counts[name] += 1
+        else:
+            print("Feature named %s in the geojson did not have %s in the csv." % (properties[OSM_KEY_NAME], attribute_key))
+    return geojson_feature
+
 def main():
     parser = argparse.ArgumentParser(description="Add a new attribute to each of the features of a geojson file based on a csv.")
     parser.add_argument("-i", "--input-geojson-path", required=True, help="Path to input geojson file")
@@ -22,44 +37,30 @@ def main():
     parser.add_argument("--append-to-csv-names", required=False, help="Add a string to the end of each name in the CSV (like 'county').")
 
     args = parser.parse_args()
-    
-    f = open(args.input_geojson_path, 'r', encoding="utf8")
-    geojson_contents = geojson.loads(f.read())
-    f.close()
 
     csv_name_addon = args.append_to_csv_names if args.append_to_csv_names else ""
 
-    name_to_value = {}
-    with open(args.csv_path, mode='r', encoding="utf8") as file:
-        csv_reader = csv.reader(file)
-        header = next(csv_reader)
-        for row in csv_reader:
-            name = standardize_string(row[args.name_index] + csv_name_addon)
-            value = row[args.value_index]
-            if args.value_type == "int":
-                value = int(value)
-            elif args.value_type == "float":
-                value = float(value)
-            name_to_value[name] = [value, 0] # Int to count how many times this value gets used
+    # Only read the two needed columns. Everything is read as a string first, the same as
+    # the csv module would, and then the value column is cast all at once.
+    df = pd.read_csv(args.csv_path, header=None, skiprows=1, usecols=[args.name_index, args.value_index], dtype=str, keep_default_na=False, encoding="utf8")
+    names = (df[args.name_index] + csv_name_addon).map(standardize_string)
+    values = df[args.value_index]
+    if args.value_type == "int":
+        values = values.astype(int)
+    elif args.value_type == "float":
+        values = values.astype(float)
+    name_to_value = dict(zip(names, values.tolist()))
+    # Count how many times each value gets used
+    name_use_counts = Counter()
 
-    for geojson_feature in geojson_contents['features']:
-        if not OSM_KEY_NAME in geojson_feature.properties or geojson_feature.properties[OSM_KEY_NAME] == None:
-            continue
-        name = standardize_string(geojson_feature.properties[OSM_KEY_NAME])
-        if name in name_to_value:
-            geojson_feature.properties[args.attribute_key] = name_to_value[name][0]
-            name_to_value[name][1] += 1
-        else:
-            print("Feature named %s in the geojson did not have %s in the csv." % (geojson_feature.properties[OSM_KEY_NAME], args.attribute_key))
+    # Stream the features one at a time rather than loading the whole file into memory.
+    output_geojson_path = args.output_geojson_path if args.output_geojson_path else args.input_geojson_path
+    rewrite_geojson_features(args.input_geojson_path, output_geojson_path,\
+            partial(add_attribute_to_feature, attribute_key=args.attribute_key, name_to_value=name_to_value, name_use_counts=name_use_counts))
 
     for key in name_to_value:
-        if name_to_value[key][1] == 0:
+        if name_use_counts[key] == 0:
             print("Row with standardized name %s in the csv was not matched with a feature in the geojson." % (key))
 
-    output_geojson_path = args.output_geojson_path if args.output_geojson_path else args.input_geojson_path
-    f = open(output_geojson_path, 'w', encoding="utf8")
-    f.write(geojson.dumps(geojson_contents))
-    f.close()
-
 if __name__ == "__main__":
     main()
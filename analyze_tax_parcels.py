@@ -7,18 +7,20 @@ some stats about how many there are.
 """
 
 import argparse
-import contextily as cx
 from enum import Enum
 import geopandas
-import json
-from matplotlib import colormaps
+import numpy as np
+import orjson
+import os
+import pyogrio
 import shapely
 import time
 
-from general_utility import parse_latlon_string, standardize_county, latlon_to_crs
+from general_utility import parse_latlon_string, standardize_county, latlon_to_crs, get_transformer
 from tax_parcel_loader import TaxParcelLoader, AttributeFilter
 
 MAX_LOADING_WIDTH_METERS = 60000
+TILE_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "contextily")
 
 class AttributeType(Enum):
     Quantitative = 1
@@ -33,21 +35,21 @@ def main():
     parser.add_argument("-k", "--parcel-keys-and-values-filename", required=True, help="Name only of JSON file mapping generic key/value names to file-specific names. This filename can appear both in the state dir and the individual county dirs.")
     parser.add_argument("-t", "--parcel-keys-types-filepath", required=True, help="Path to JSON file mapping generic key/value names to types.")
     parser.add_argument("--already-sfh", action='store_true', help="If the dataset only contains single-family-homes, no need to filter.")
-    parser.add_argument("--min-year-built", required=False, type=int, help="Oldest year you want a house to be built in.")
-    parser.add_argument("--max-year-built", required=False, type=int, help="Newest year you want a house to be built in.")
-    parser.add_argument("--min-sqft", required=False, type=int, help="Minimum square footage you want a house to have.")
-    parser.add_argument("--max-sqft", required=False, type=int, help="Maximum square footage you want a house to have.")
-    parser.add_argument("--min-acres", required=False, type=float, help="Minimum number of acres you want a house to have.")
-    parser.add_argument("--max-acres", required=False, type=float, help="Maximum number of acres you want a house to have.")
+    parser.add_argument("--min-year-built", required=False, type=int, default=0, help="Oldest year you want a house to be built in.")
+    parser.add_argument("--max-year-built", required=False, type=int, default=9999, help="Newest year you want a house to be built in.")
+    parser.add_argument("--min-sqft", required=False, type=int, default=0, help="Minimum square footage you want a house to have.")
+    parser.add_argument("--max-sqft", required=False, type=int, default=99999, help="Maximum square footage you want a house to have.")
+    parser.add_argument("--min-acres", required=False, type=float, default=0, help="Minimum number of acres you want a house to have.")
+    parser.add_argument("--max-acres", required=False, type=float, default=99999, help="Maximum number of acres you want a house to have.")
     parser.add_argument("--require-connected-water", action='store_true', help="If you want the house to have public water.")
     parser.add_argument("--require-connected-sewer", action='store_true', help="If you want the house to have public sewer.")
     parser.add_argument("--school-district", required=False, help="Desired school district.")
     parser.add_argument("--city", required=False, help="Desired city.")
     parser.add_argument("--municipality", required=False, help="Desired municipality.")
     parser.add_argument("--zip-code", required=False, help="Desired zip code.")
-    parser.add_argument("--min-beds", required=False, type=int, help="Minimum number of bedrooms you want a house to have.")
-    parser.add_argument("--min-baths", required=False, type=float, help="Minimum number of bathrooms you want a house to have.")
-    parser.add_argument("--output-filepath", required=False, help="Save filtered dataframe to filepath.")
+    parser.add_argument("--min-beds", required=False, type=int, default=0, help="Minimum number of bedrooms you want a house to have.")
+    parser.add_argument("--min-baths", required=False, type=float, default=0, help="Minimum number of bathrooms you want a house to have.")
+    parser.add_argument("--output-filepath", required=False, help="Save filtered dataframe to filepath. A .parquet extension writes GeoParquet.")
     parser.add_argument("--folium-filepath", required=False, help="Save interactive Folium map to HTML file.")
     parser.add_argument("--plot-key", required=False, help="The feature that colors the plot, if any. (%s)" % (attribute_keys_string))
     parser.add_argument("--plot-filtered-filepath", required=False, help="Plot the remaining points after filtering, save to image path.")
@@ -62,7 +64,7 @@ def main():
     parser.add_argument("--markersize", required=False, type=int, help="Markersize for the plots. Defaults to 15.")
     parser.add_argument("--figsize", required=False, type=int, help="Figure size for the plots. Defaults to 10.")
     parser.add_argument("--tile-source", required=False, default='OpenStreetMap.Mapnik', help="Tile source for Folium. Defaults to 'OpenStreetMap.Mapnik'. Some others are 'Esri.WorldImagery', 'Esri.WorldStreetMap', 'CartoDB.Positron', 'CartoDB.Voyager', 'USGS.USImagery', 'TopPlusOpen.Grey', 'Stadia.AlidadeSmooth")
-    parser.add_argument("--max-folium-points", required=False, default=40000, help="Max number of points for interactive folium map. Defaults to 40k.")
+    parser.add_argument("--max-folium-points", required=False, type=int, default=40000, help="Max number of points for interactive folium map. Defaults to 40k.")
 
     args = parser.parse_args()
     start_time = time.time()
@@ -72,14 +74,11 @@ def main():
     #                    Load JSON Data About Keys
     #
     # ==================================================================
-    f = open(args.parcel_keys_types_filepath, 'r')
-    general_name_to_type = json.loads(f.read())
+    f = open(args.parcel_keys_types_filepath, 'rb')
+    general_name_to_type_name = orjson.loads(f.read())
     f.close()
-    for name in general_name_to_type:
-        if general_name_to_type[name] in ('int', 'float'):
-            general_name_to_type[name] = AttributeType.Quantitative
-        else:
-            general_name_to_type[name] = AttributeType.Qualitative
+    general_name_to_type = {name : AttributeType.Quantitative if type_name in ('int', 'float') else AttributeType.Qualitative\
+            for name, type_name in general_name_to_type_name.items()}
 
     # ==================================================================
     #
@@ -103,12 +102,14 @@ def main():
     if args.width_meters and args.width_meters > MAX_LOADING_WIDTH_METERS:
         raise ValueError("Requested width (%d meters) is greater than max allowed width (%d meters)." % (args.width_meters, MAX_LOADING_WIDTH_METERS))
     if args.height_meters and args.height_meters > MAX_LOADING_WIDTH_METERS:
-        raise ValueError("Requested height (%d meters) is greater than max allowed height (%d meters)." % (args.height_meters, MAX_LOADING_HEIGHT_METERS))
+        raise ValueError("Requested height (%d meters) is greater than max allowed height (%d meters)." % (args.height_meters, MAX_LOADING_WIDTH_METERS))
 
     plot_attribute_type = general_name_to_type[args.plot_key] if args.plot_key else None
     if args.colormap:
-        if not args.colormap in list(colormaps):
-            raise ValueError("The specified colormap (%s) is not in the list of options: " % (args.colormap) + list(colormaps))
+        # Only import matplotlib when a plot is actually requested.
+        from matplotlib import colormaps
+        if not args.colormap in colormaps:
+            raise ValueError("The specified colormap (%s) is not in the list of options: %s" % (args.colormap, ", ".join(sorted(colormaps))))
         else:
             colormap = args.colormap
     else:
@@ -161,14 +162,13 @@ def main():
     if args.input_filepath:
         print("Loading %s." % (args.input_filepath))
         if args.center_latlon:    
-            bbox = geopandas.GeoSeries([\
-                        shapely.Point(center_x - width/2, center_y - height/2),\
-                        shapely.Point(center_x + width/2, center_y + height/2)\
-                        ], crs="EPSG:3857")
-            gdf = geopandas.read_file(args.input_filepath, bbox=bbox, engine='fiona')
+            # Transform the bbox into the file's CRS directly rather than building a GeoSeries.
+            file_crs = pyogrio.read_info(args.input_filepath)['crs']
+            bbox = get_transformer("EPSG:3857", file_crs).transform_bounds(center_x - width/2, center_y - height/2, center_x + width/2, center_y + height/2)
+            gdf = geopandas.read_file(args.input_filepath, bbox=bbox, engine='pyogrio', use_arrow=True)
         else:
             # For a single file, it is allowed to load the entire file with no bbox.
-            gdf = geopandas.read_file(args.input_filepath)
+            gdf = geopandas.read_file(args.input_filepath, engine='pyogrio', use_arrow=True)
     else:
         print("Loading parcels from county files contained in %s." % (args.state_dir))
         attribute_filter = AttributeFilter(args.already_sfh, args.require_connected_water, args.require_connected_sewer, args.min_year_built, args.max_year_built, args.min_sqft, args.max_sqft, args.min_acres, args.max_acres, args.min_beds, args.min_baths, args.county, args.school_district, args.city, args.municipality, args.zip_code)
@@ -192,18 +192,35 @@ def main():
     #
     # ==================================================================
     if args.radius_meters:
-        gdf['distance_to_center'] = gdf['geometry'].centroid.distance(shapely.Point((center_x, center_y)))
-        gdf = gdf[gdf['distance_to_center'] <= args.radius_meters]
-        gdf.drop('distance_to_center', axis='columns', inplace=True)
+        # The data was already loaded by the circle's bounding box, so a spatial index
+        # would not prune much. Compare squared distances on the raw centroid coordinates
+        # so the test is plain numpy arithmetic rather than a GEOS call per parcel.
+        geometries = gdf['geometry'].to_numpy()
+        if args.convert_to_centroid or (shapely.get_type_id(geometries) == shapely.GeometryType.POINT).all():
+            # Points are their own centroids, so skip building a new array.
+            centroids = geometries
+        else:
+            centroids = shapely.centroid(geometries)
+        xs = shapely.get_x(centroids)
+        ys = shapely.get_y(centroids)
+        gdf = gdf[(xs - center_x)**2 + (ys - center_y)**2 <= args.radius_meters**2]
         print("Only %d parcels lie within the %.2f meter radius." % (len(gdf), args.radius_meters))
 
+    if len(gdf) == 0:
+        print("No parcels remain after filtering.")
+        print("Total time: %.2f" % (time.time() - start_time))
+        return
+
     # ==================================================================
     #
     #              Save the filtered dataframe to a GIS file
     #
     # ==================================================================
     if args.output_filepath:
-        gdf.to_file(args.output_filepath)
+        if args.output_filepath.lower().endswith(".parquet"):
+            gdf.to_parquet(args.output_filepath)
+        else:
+            gdf.to_file(args.output_filepath, engine='pyogrio')
         print("Saved filtered dataframe to %s." % (args.output_filepath))
 
     # ==================================================================
@@ -212,14 +229,21 @@ def main():
     #
     # ==================================================================
     if args.plot_filtered_filepath:
+        import contextily as cx
         if args.plot_key:
-            if gdf[args.plot_key].isnull().values.all(axis=0):
+            if gdf[args.plot_key].count() == 0:
                 raise ValueError("Cannot make plot with %s as the key because that column is all null." % (args.plot_key))
             ax = gdf.plot(args.plot_key, figsize=(fs, fs), legend=True, markersize=ms, cmap=colormap)
         else:
             ax = gdf.plot(figsize=(fs, fs), legend=True, markersize=ms, cmap=colormap)
+        # Rasterize the markers so vector formats don't store a separate path for every parcel.
+        for collection in ax.collections:
+            collection.set_rasterized(True)
+        # Keep downloaded tiles between runs instead of contextily's per-session temp dir.
+        os.makedirs(TILE_CACHE_DIR, exist_ok=True)
+        cx.set_cache_dir(TILE_CACHE_DIR)
         cx.add_basemap(ax, source=cx.providers.Esri.WorldStreetMap)
-        ax.figure.savefig(args.plot_filtered_filepath)
+        ax.figure.savefig(args.plot_filtered_filepath, dpi=150, bbox_inches='tight')
         print("Saved filtered plot to %s." % (args.plot_filtered_filepath))
 
     # ==================================================================
@@ -229,13 +253,17 @@ def main():
     # ==================================================================
     if len(gdf) > args.max_folium_points:
         print("Warning! Too many points. Randomly dropping %d parcels." % (len(gdf) - args.max_folium_points))
-        gdf = gdf.sample(frac=args.max_folium_points / len(gdf))
+        # Sorting the sampled positions keeps the parcels in their original order.
+        sample_indices = np.random.default_rng().choice(len(gdf), size=args.max_folium_points, replace=False, shuffle=False)
+        gdf = gdf.take(np.sort(sample_indices))
     if args.folium_filepath:
         if args.plot_key:
             ignore_outliers = args.outlier_percentile != None and plot_attribute_type == AttributeType.Quantitative
-            q_low = gdf[args.plot_key].quantile(args.outlier_percentile) if ignore_outliers  else None
-            q_hi  = gdf[args.plot_key].quantile(1 - args.outlier_percentile) if ignore_outliers else None
-            if gdf[args.plot_key].isnull().values.all(axis=0):
+            q_low, q_hi = None, None
+            if ignore_outliers:
+                # Both quantiles from a single pass over the column.
+                q_low, q_hi = gdf[args.plot_key].quantile([args.outlier_percentile, 1 - args.outlier_percentile]).tolist()
+            if gdf[args.plot_key].count() == 0:
                 raise ValueError("Cannot make folium map with %s as the key because that column is all null." % (args.plot_key))
             m = gdf.explore(args.plot_key, legend=True, cmap=colormap, markersize=ms, tiles=args.tile_source, vmin=q_low, vmax=q_hi)
         else:
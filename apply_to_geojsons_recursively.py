@@ -6,80 +6,106 @@ whose names end with a certain suffix.
 """
 
 import argparse
-import geojson
+from functools import partial
 import geopandas
+import ijson
 import json
+import multiprocessing
+import numpy as np
+import orjson
 import shapely
 import ntpath
 import os
-import time
 
-from general_utility import list_files_recursive, get_time_estimate_string
-from geojson_utility import geojson_feature_to_shapely, shapely_polygon_to_geojson
-
-def count_files(parent_dir, filename_suffix):
-    count = 0
-    for full_path in list_files_recursive(parent_dir):
-        filename = ntpath.basename(full_path)
-        if not filename_suffix or filename.split('.')[0].endswith(filename_suffix):
-            count += 1
-    return count
+from general_utility import list_files_recursive, ProgressPrinter
 
 def create_bbox_file(full_path, filename_suffix):
-    f = open(full_path, 'r', encoding="utf8")
-    geojson_contents = geojson.loads(f.read())
+    # Only the first feature is needed, so stream it rather than parsing the whole file.
+    f = open(full_path, 'rb')
+    features = ijson.items(f, 'features.item', use_float=True)
+    first_feature = next(features, None)
+    has_single_feature = first_feature != None and next(features, None) == None
     f.close()
 
-    if len(geojson_contents['features']) != 1:
+    if not has_single_feature:
         print("%s does not contain a single geojson feature." % (full_path))
         return
-    shapely_polygon = geojson_feature_to_shapely(geojson_contents['features'][0])
-    min_x, min_y, max_x, max_y = shapely_polygon[0].bounds
-    bbox_polygon = shapely.Polygon((\
-            (min_x, min_y),\
-            (max_x, min_y),\
-            (max_x, max_y),\
-            (min_x, max_y),\
-            (min_x, min_y)))
-    feature = geojson.Feature(geometry=shapely_polygon_to_geojson(bbox_polygon), properties=geojson_contents['features'][0].properties)
+    geometry = first_feature['geometry']
+    if geometry['type'] not in ("Polygon", "MultiPolygon"):
+        print("%s does not contain a polygon." % (full_path))
+        return
+    # Use the outer boundary of the (first) polygon
+    coordinates = geometry['coordinates'][0] if geometry['type'] == "Polygon" else geometry['coordinates'][0][0]
+    coordinates = np.asarray(coordinates, dtype=float)[:, :2]
+    min_x, min_y = coordinates.min(axis=0).tolist()
+    max_x, max_y = coordinates.max(axis=0).tolist()
+    bbox_polygon = shapely.box(min_x, min_y, max_x, max_y)
+    feature = {"type": "Feature", "geometry": shapely.geometry.mapping(bbox_polygon), "properties": first_feature['properties']}
     if filename_suffix:
         output_filepath = full_path.replace(filename_suffix + ".", filename_suffix + "Bbox" + ".")
     else:
         output_filepath = full_path.replace(".", "Bbox" + ".")
-    dump = geojson.dumps(geojson.FeatureCollection(features=[feature]))
-    f = open(output_filepath, 'w')
-    f.write(dump)
+    f = open(output_filepath, 'wb')
+    f.write(orjson.dumps({"type": "FeatureCollection", "features": [feature]}))
     f.close()
 
 def reproject_to_epsg(full_path, epsg):
-    gdf = geopandas.read_file(full_path)
+    gdf = geopandas.read_file(full_path, engine='pyogrio', use_arrow=True)
     gdf = gdf.to_crs(int(epsg))
-    gdf.to_file(full_path)    
+    gdf.to_file(full_path, engine='pyogrio')    
 
-def sanitize_tags(geojson_path, keys_and_values_json_path):
+def sanitize_tags(geojson_path, general_name_to_specific_name):
     orig_size = os.stat(geojson_path).st_size
-    gdf = geopandas.read_file(geojson_path)
-    f = open(keys_and_values_json_path, 'r')
-    general_name_to_specific_name = json.loads(f.read())
-    f.close()
+    # Skip reading the attributes that are about to be dropped
+    gdf = geopandas.read_file(geojson_path, engine='pyogrio', use_arrow=True, columns=list(general_name_to_specific_name['keys'].values()))
     gdf = gdf.rename(columns={value: key for key, value in general_name_to_specific_name['keys'].items()})
     desired_keys = list(general_name_to_specific_name['keys'].keys()) + ['geometry']
     gdf = gdf[desired_keys]
-    gdf.to_file(geojson_path)
+    gdf.to_file(geojson_path, engine='pyogrio')
     print("Reduced size by %.1f%% for %s." % (100 - os.stat(geojson_path).st_size / orig_size * 100, geojson_path))
 
 def harmonize_tag(geojson_path, key, bad_value, good_value):
-    gdf = geopandas.read_file(geojson_path)
-    gdf.loc[gdf[key] == bad_value, key] = good_value
-    gdf.to_file(geojson_path)
+    gdf = geopandas.read_file(geojson_path, engine='pyogrio', use_arrow=True)
+    mask = gdf[key] == bad_value
+    # Writing is the slowest part, so skip it when nothing changes
+    if not mask.any():
+        return
+    gdf.loc[mask, key] = good_value
+    gdf.to_file(geojson_path, engine='pyogrio')
 
 def restrict_to_attribute(geojson_path, key, required_value):
     orig_size = os.stat(geojson_path).st_size
-    gdf = geopandas.read_file(geojson_path)
-    gdf = gdf[gdf[key] == required_value]
-    gdf.to_file(geojson_path)
+    gdf = geopandas.read_file(geojson_path, engine='pyogrio', use_arrow=True)
+    mask = gdf[key] == required_value
+    if mask.all():
+        print("All features already have %s=%s in %s." % (key, required_value, geojson_path))
+        return
+    gdf = gdf[mask]
+    gdf.to_file(geojson_path, engine='pyogrio')
     print("Reduced size by %.1f%% for %s." % (100 - os.stat(geojson_path).st_size / orig_size * 100, geojson_path))
 
+def is_target_file(full_path, filename_suffix):
+    filename = ntpath.basename(full_path)
+    return filename.endswith("geojson") and (not filename_suffix or filename.split('.')[0].endswith(filename_suffix))
+
+def apply_operation(full_path, args, general_name_to_specific_name):
+    """
+    Apply whichever operation was requested on the command line to one file.
+    This is a module-level function so that it can run in a worker process.
+    """
+    if args.add_bbox_file:
+        create_bbox_file(full_path, args.filename_suffix)
+    elif args.reproject_to_epsg:
+        reproject_to_epsg(full_path, args.reproject_to_epsg)
+    elif args.sanitize_tags:
+        sanitize_tags(full_path, general_name_to_specific_name)
+    elif args.harmonize_tag:
+        key, bad_value, good_value = args.harmonize_tag.split('+')
+        harmonize_tag(full_path, key, bad_value, good_value)
+    elif args.restrict_to_attribute:
+        key, value = args.restrict_to_attribute.split('+')
+        restrict_to_attribute(full_path, key, value)
+
 def main():
     parser = argparse.ArgumentParser(description="Apply operations to geojson files.")
     parser.add_argument("-d", "--parent-dir", required=True, help="Path to parent directory.")
@@ -93,29 +119,25 @@ def main():
 
     args = parser.parse_args()
 
-    start_time = time.time()
-    num_files = count_files(args.parent_dir, args.filename_suffix)
+    # Load the keys and values once instead of once per file
+    general_name_to_specific_name = None
+    if args.sanitize_tags:
+        f = open(args.sanitize_tags, 'r')
+        general_name_to_specific_name = json.loads(f.read())
+        f.close()
+
+    # Walk the directory tree once, and use the same list for counting and processing
+    target_paths = [full_path for full_path in list_files_recursive(args.parent_dir) if is_target_file(full_path, args.filename_suffix)]
+    num_files = len(target_paths)
     num_completed = 0
-    for full_path in list_files_recursive(args.parent_dir):
-        filename = ntpath.basename(full_path)
-        if filename.endswith("geojson") and (not args.filename_suffix or filename.split('.')[0].endswith(args.filename_suffix)):
-            if args.add_bbox_file:
-                create_bbox_file(full_path, args.filename_suffix)
-            elif args.reproject_to_epsg:
-                reproject_to_epsg(full_path, args.reproject_to_epsg)
-            elif args.sanitize_tags:
-                sanitize_tags(full_path, args.sanitize_tags)
-            elif args.harmonize_tag:
-                key, bad_value, good_value = args.harmonize_tag.split('+')
-                harmonize_tag(full_path, key, bad_value, good_value)
-            elif args.restrict_to_attribute:
-                key, value = args.restrict_to_attribute.split('+')
-                restrict_to_attribute(full_path, key, value)
+    progress = ProgressPrinter(num_files)
+    # Each file is independent, so spread them across processes.
+    with multiprocessing.Pool() as pool:
+        for _ in pool.imap_unordered(partial(apply_operation, args=args, general_name_to_specific_name=general_name_to_specific_name), target_paths):
             # Log the status
             num_completed += 1
-            time_elapsed = int(time.time() - start_time)
-            print(get_time_estimate_string(time_elapsed, num_completed, num_files), end='\r')
-    print()
+            progress.update(num_completed)
+    progress.finish(num_completed)
 
 if __name__ == "__main__":
     main()
@@ -12,9 +12,11 @@ def main():
 
     args = parser.parse_args()
 
-    df = pd.read_csv(args.input_csv_path, encoding = "ISO-8859-1")
+    # Read everything as text so the comparison with the command-line value is exact
+    # and the kept rows are written back unchanged.
+    df = pd.read_csv(args.input_csv_path, encoding = "ISO-8859-1", dtype=str, keep_default_na=False)
     df = df[df[args.key] == args.value]
-    df.to_csv(args.output_csv_path)
+    df.to_csv(args.output_csv_path, index=False)
 
 if __name__ == "__main__":
     main()
@@ -1,9 +1,9 @@
 #!/usr/bin/env python3
 
-import geopandas
+from functools import lru_cache
 import os
-import pandas as pd
-import shapely
+from pyproj import Transformer
+import time
 from unidecode import unidecode
 
 COMMON_ABBREVIATIONS = (\
@@ -29,32 +29,44 @@ COMMON_ABBREVIATIONS = (\
         ("west", "w")
         )
 
+# Characters that standardize_string deletes, as a table for str.translate
+REMOVED_CHARACTERS_TABLE = str.maketrans('', '', " -'")
+
+CITY_SUFFIXES = ("(city)", "(town)", "(village)")
+CITY_PREFIXES = ("townof", "cityof", "villageof")
+
+PROGRESS_PRINT_INTERVAL_SECONDS = 0.25
+
+@lru_cache(maxsize=None)
 def standardize_string(s):
     """
     Remove accents, make letters lowercase, remove spaces and punctuation.
     This way names from different sources can be compared directly.
     """
-    cleaned = unidecode(s).lower().replace(' ', '').replace('-', '').replace('\'', '').strip()  
+    # Most names are already plain ASCII, and unidecode would not change them
+    if not s.isascii():
+        s = unidecode(s)
+    cleaned = s.lower().translate(REMOVED_CHARACTERS_TABLE).strip()
+    # The order matters, since some words contain others (e.g. street and east)
     for word, abbr in COMMON_ABBREVIATIONS:
         cleaned = cleaned.replace(word, abbr)
     return cleaned
 
+@lru_cache(maxsize=None)
 def standardize_city(city):
     city = standardize_string(city)
-    if city.endswith("(city)"):
-        return city[:-len("(city)")]
-    if city.endswith("(town)"):
-        return city[:-len("(town)")]
-    if city.endswith("(village)"):
-        return city[:-len("(village)")]
-    if city.startswith("townof"):
-        return city[len("townof"):]
-    if city.startswith("cityof"):
-        return city[len("cityof"):]
-    if city.startswith("villageof"):
-        return city[len("villageof"):]
+    # Most names have none of these, which takes one check for each tuple
+    if city.endswith(CITY_SUFFIXES):
+        for suffix in CITY_SUFFIXES:
+            if city.endswith(suffix):
+                return city.removesuffix(suffix)
+    if city.startswith(CITY_PREFIXES):
+        for prefix in CITY_PREFIXES:
+            if city.startswith(prefix):
+                return city.removeprefix(prefix)
     return city
 
+@lru_cache(maxsize=None)
 def standardize_county(county):
     county = standardize_string(county)
     if county.endswith("county"):
@@ -77,12 +89,13 @@ def parse_latlon_string(latlon_string):
     return (float(lat.strip()), float(lon.strip()))
 
 def list_files_recursive(path):
-    for entry in os.listdir(path):
-        full_path = os.path.join(path, entry)
-        if os.path.isdir(full_path):
-            yield from list_files_recursive(full_path)
-        else:
-            yield full_path
+    # scandir gets the entry type from the directory listing, so no stat call per entry
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                yield from list_files_recursive(entry.path)
+            else:
+                yield entry.path
 
 def get_time_estimate_string(time_elapsed, num_complete, num_total):
     percent_complete = float(num_complete) / float(num_total) * 100
@@ -108,11 +121,41 @@ def get_time_estimate_string(time_elapsed, num_complete, num_total):
 
     return "Completed %d/%d (%.1f percent) in %s" % (num_complete, num_total, percent_complete, time_string)
 
-def num_rows_in_csv(csv_path):
-    df = pd.read_csv(csv_path)
-    return df.shape[0]
+class ProgressPrinter:
+    """
+    Print get_time_estimate_string on one line, but at most a few times per second,
+    since formatting and printing it can cost more than a small unit of work.
+    """
+    def __init__(self, num_total):
+        self.num_total = num_total
+        self.start_time = time.monotonic()
+        self.last_print_time = None
+
+    def update(self, num_complete):
+        current_time = time.monotonic()
+        if self.last_print_time != None and current_time - self.last_print_time < PROGRESS_PRINT_INTERVAL_SECONDS:
+            return
+        self.last_print_time = current_time
+        time_elapsed = int(current_time - self.start_time)
+        print(get_time_estimate_string(time_elapsed, num_complete, self.num_total), end='\r')
+
+    def finish(self, num_complete):
+        """
+        Print the final count, even if the last updates were throttled, and end the line.
+        """
+        if num_complete == 0:
+            print("Completed 0/%d" % (self.num_total))
+            return
+        time_elapsed = int(time.monotonic() - self.start_time)
+        print(get_time_estimate_string(time_elapsed, num_complete, self.num_total))
+
+@lru_cache(maxsize=None)
+def get_transformer(source_crs, target_crs):
+    """
+    Building a Transformer is much slower than using one, so reuse them.
+    Coordinates are always given in x,y (lon,lat) order.
+    """
+    return Transformer.from_crs(source_crs, target_crs, always_xy=True)
 
 def latlon_to_crs(lat, lon, epsg):
-    gdf = geopandas.GeoDataFrame({'geometry':[shapely.Point(lon, lat)]}, crs=4326)
-    gdf = gdf.to_crs(epsg)
-    return gdf.loc[0]['geometry'].x, gdf.loc[0]['geometry'].y
+    return get_transformer(4326, epsg).transform(lon, lat)
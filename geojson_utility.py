@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import geojson
+import ijson
+import orjson
 import os
 import shapely
 import sys
@@ -143,3 +145,72 @@ def geojson_to_city_dictionary(file_contents):
         lat, lon = geojson_feature.geometry["coordinates"][1], geojson_feature.geometry["coordinates"][0]
         cities_to_latlon[city_name] = (lat, lon)
     return cities_to_latlon
+
+def write_updated_features(input_file, output_file, update_feature):
+    """
+    Does the streaming for rewrite_geojson_features, from one open file to another.
+    """
+    member_key = None
+    member_builder = None
+    feature_builder = None
+    is_first_member = True
+    is_first_feature = True
+    for prefix, event, value in ijson.parse(input_file, use_float=True):
+        if prefix == '':
+            # A top-level member other than the features is complete once the next one starts.
+            if member_builder != None:
+                output_file.write(orjson.dumps(member_builder.value))
+                member_builder = None
+            if event == 'start_map':
+                output_file.write(b'{')
+            elif event == 'end_map':
+                output_file.write(b'}')
+            elif event == 'map_key':
+                if not is_first_member:
+                    output_file.write(b', ')
+                is_first_member = False
+                output_file.write(orjson.dumps(value) + b': ')
+                member_key = value
+                if member_key != 'features':
+                    member_builder = ijson.ObjectBuilder()
+        elif member_key != 'features':
+            member_builder.event(event, value)
+        elif prefix == 'features':
+            if event == 'start_array':
+                output_file.write(b'[')
+            elif event == 'end_array':
+                output_file.write(b']')
+            else:
+                output_file.write(orjson.dumps(value))
+        else:
+            if feature_builder == None:
+                feature_builder = ijson.ObjectBuilder()
+            feature_builder.event(event, value)
+            if prefix == 'features.item' and event == 'end_map':
+                if not is_first_feature:
+                    output_file.write(b', ')
+                is_first_feature = False
+                output_file.write(orjson.dumps(update_feature(feature_builder.value)))
+                feature_builder = None
+
+def rewrite_geojson_features(input_path, output_path, update_feature):
+    """
+    Stream a FeatureCollection one feature at a time, passing each feature dict
+    through update_feature before writing it. Every other top-level member (crs,
+    name, etc.) is copied through unchanged and in its original position.
+    Writes to a temporary file first, since the output path may be the input path.
+    """
+    temp_output_path = output_path + ".tmp"
+    input_file = open(input_path, 'rb')
+    output_file = open(temp_output_path, 'wb')
+    succeeded = False
+    try:
+        write_updated_features(input_file, output_file, update_feature)
+        succeeded = True
+    finally:
+        output_file.close()
+        input_file.close()
+        # Don't leave a partial file behind if the parser or update_feature failed
+        if not succeeded:
+            os.remove(temp_output_path)
+    os.replace(temp_output_path, output_path)
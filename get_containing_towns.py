@@ -1,13 +1,12 @@
 #!/usr/bin/env python3
 
 import argparse
-import geojson
+import ijson
 import json
+import numpy as np
 import shapely
-import time
 
-from general_utility import get_time_estimate_string, standardize_city
-from geojson_utility import geojson_feature_to_shapely
+from general_utility import ProgressPrinter, standardize_city
 
 def main():
     parser = argparse.ArgumentParser(description="Create a json file mapping cities/villages to the towns containing them.")
@@ -16,41 +15,65 @@ def main():
 
     args = parser.parse_args()
 
-    f = open(args.input_geojson_path, 'r', encoding='utf-8')
-    geojson_contents = geojson.loads(f.read())
-    f.close()
-
-    print("Loading %d municipality polygons." % (len(geojson_contents['features'])))
+    # Stream the features so the whole file is never held in memory at once
+    print("Loading municipality polygons.")
     name_to_polygon = {}
     name_to_area = {}
-    for geojson_feature in geojson_contents['features']:
+    f = open(args.input_geojson_path, 'rb')
+    for geojson_feature in ijson.items(f, 'features.item', use_float=True):
         if geojson_feature['properties']['name']:
-            polygon = geojson_feature_to_shapely(geojson_feature)[0]
+            polygon = shapely.geometry.shape(geojson_feature['geometry'])
+            if polygon.geom_type == "MultiPolygon":
+                polygon = polygon.geoms[0]
             polygon = shapely.Polygon(polygon.exterior)
             name_to_polygon[geojson_feature['properties']['name']] = polygon
             name_to_area[geojson_feature['properties']['name']] = polygon.area
+    f.close()
 
-    start_time = time.time()
     num_completed = 0
     num_points = len(name_to_polygon)
+    progress = ProgressPrinter(num_points)
     print("Checking polygons for a containing town.")
+    # Only polygons that actually intersect can contain each other, so use a
+    # spatial index to find those candidates.
+    names = list(name_to_polygon.keys())
+    areas = np.array([name_to_area[name] for name in names])
+    bounds = shapely.bounds(list(name_to_polygon.values()))
+    name_to_standardized = {name: standardize_city(name) for name in names}
+    tree = shapely.STRtree(list(name_to_polygon.values()))
+    # Each polygon is tested against many others, so build its GEOS index once
+    shapely.prepare(list(name_to_polygon.values()))
     contained_to_containing = {}
     for contained_name in name_to_polygon:
-        for containing_name in name_to_polygon:
+        # Sort the candidates to check them in the same order as the names
+        candidate_indices = np.sort(tree.query(name_to_polygon[contained_name], predicate='intersects'))
+        # The intersection can't be bigger than the containing polygon or the overlap of
+        # the bounding boxes, so skip the candidates where either is too small.
+        min_area = 0.5 * name_to_area[contained_name]
+        contained_bounds = name_to_polygon[contained_name].bounds
+        candidate_bounds = bounds[candidate_indices]
+        overlap_widths = np.minimum(candidate_bounds[:, 2], contained_bounds[2]) - np.maximum(candidate_bounds[:, 0], contained_bounds[0])
+        overlap_heights = np.minimum(candidate_bounds[:, 3], contained_bounds[3]) - np.maximum(candidate_bounds[:, 1], contained_bounds[1])
+        overlap_areas = np.clip(overlap_widths, 0, None) * np.clip(overlap_heights, 0, None)
+        candidate_indices = candidate_indices[(areas[candidate_indices] > min_area) & (overlap_areas > min_area)]
+        for containing_name in (names[i] for i in candidate_indices):
             if contained_name == containing_name:
                 continue
             # If the intersection between the polygons is more than 50% of the size
             # of the first polygon, we say there is containment.
-            intersection = name_to_polygon[containing_name].intersection(name_to_polygon[contained_name])
-            if intersection.area > 0.5 * name_to_area[contained_name]:
-                if standardize_city(contained_name) != standardize_city(containing_name):
-                    contained_to_containing[standardize_city(contained_name)] = standardize_city(containing_name)
+            # A polygon that is entirely inside the other one doesn't need the intersection computed.
+            if name_to_polygon[containing_name].contains(name_to_polygon[contained_name]):
+                intersection_area = name_to_area[contained_name]
+            else:
+                intersection_area = name_to_polygon[containing_name].intersection(name_to_polygon[contained_name]).area
+            if intersection_area > 0.5 * name_to_area[contained_name]:
+                if name_to_standardized[contained_name] != name_to_standardized[containing_name]:
+                    contained_to_containing[name_to_standardized[contained_name]] = name_to_standardized[containing_name]
                 break
         # Log the status
         num_completed += 1
-        time_elapsed = int(time.time() - start_time)
-        print(get_time_estimate_string(time_elapsed, num_completed, num_points), end='\r')
-    print()
+        progress.update(num_completed)
+    progress.finish(num_completed)
 
 
     f = open(args.output_json_path, 'w')
@@ -12,14 +12,14 @@ Fayetteville is in Fayetteville (the proper village) or Manlius (the surrounding
 
 import argparse
 import csv
-import geojson
+import geopandas
 import json
+import numpy as np
+import orjson
+import pandas as pd
 import time
 
-from general_utility import standardize_string, standardize_city, get_time_estimate_string, num_rows_in_csv
-
-class CantParseAddressError(Exception):
-    pass
+from general_utility import standardize_string, standardize_city, ProgressPrinter
 
 def string_fraction_to_value(s):
     """
@@ -37,13 +37,16 @@ def string_fraction_to_value(s):
         return None
 
 def split_address(address):
+    """
+    Split an address into its number and standardized road.
+    Return None if it does not start with a number followed by a street.
+    """
     number_road_pieces = address.split()
     if len(number_road_pieces) < 2:
-        raise CantParseAddressError("%s does not have both a number and a street." % (address))
-    try:
-        number = int(number_road_pieces[0])
-    except ValueError:
-        raise CantParseAddressError("%s does not start with a number." % (address))
+        return None
+    if not number_road_pieces[0].isdecimal():
+        return None
+    number = int(number_road_pieces[0])
 
     # Handle the case of "30 1/2 Main St"
     maybe_fraction_value = string_fraction_to_value(number_road_pieces[1])
@@ -55,6 +58,19 @@ def split_address(address):
 
     return (number, road)
 
+def find_address_point(address_points, containing_towns, state, city, number_and_road):
+    """
+    Return the (lat, lon) of the address, checking the containing town if it's
+    not found in the city itself. Return None if there is no match.
+    """
+    if number_and_road == None:
+        return None
+    number, road = number_and_road
+    latlon_point = address_points.get((state, city, road, number))
+    if latlon_point == None and city in containing_towns:
+        latlon_point = address_points.get((state, containing_towns[city], road, number))
+    return latlon_point
+
 def main():
     parser = argparse.ArgumentParser(description="Create a geojson file from CSV of addresses with sale info by combining with geojson file of addresses.")
     parser.add_argument("-i", "--input-csv-path", required=True, help="Path to input CSV file")
@@ -79,122 +95,95 @@ def main():
         containing_towns = json.loads(f.read())
         f.close()
 
-    # Load all of the address points
+    # Load all of the address points, with only the needed attributes
     print("Loading file of address points.")
     start_time = time.time()
-    f = open(args.addresses_filepath, 'r', encoding="utf8")
-    geojson_contents = geojson.loads(f.read())
-    f.close()
+    key_columns = [args.city_column_name, args.address_column_name]
+    if not args.single_state:
+        key_columns.append(args.state_column_name)
+    gdf = geopandas.read_file(args.addresses_filepath, engine='pyogrio', use_arrow=True, columns=key_columns)
     print("Loaded address points in %f seconds." % (time.time() - start_time))
 
-    # Store the address points by [state][city][street][number]
+    # Drop the points that are missing any of the needed attributes
+    has_keys = np.ones(len(gdf), dtype=bool)
+    for column in key_columns:
+        has_keys &= (gdf[column].notna() & gdf[column].astype(bool)).to_numpy() if column in gdf.columns else False
+    gdf = gdf[has_keys]
+
+    # Standardize each column at once. The functions are cached, so repeated names are cheap.
+    if args.single_state:
+        states = [standardize_string(args.single_state)] * len(gdf)
+    else:
+        states = gdf[args.state_column_name].map(standardize_string)
+    cities = gdf[args.city_column_name].map(standardize_string)
+    numbers_and_streets = gdf[args.address_column_name].map(split_address)
+    lats = gdf.geometry.y.to_numpy().tolist()
+    lons = gdf.geometry.x.to_numpy().tolist()
+    del(gdf)
+
+    # Store the address points by (state, city, street, number)
     print("Storing address points in dictionary.")
     num_completed = 0
-    start_time = time.time()
-    num_points = len(geojson_contents['features'])
+    num_points = len(lats)
+    progress = ProgressPrinter(num_points)
     address_points = {}
-    for geojson_feature in geojson_contents['features']:
-        # Extract the state, city, number, and address from the tags.
-        props = geojson_feature.properties
-        if args.single_state:
-            state = standardize_string(args.single_state)
-        elif not args.state_column_name in props or not props[args.state_column_name]:
-            continue
-        else:
-            state = standardize_string(props[args.state_column_name])
-        if not args.city_column_name in props or not props[args.city_column_name]:
-            continue
-        city = standardize_string(props[args.city_column_name])
-        if not args.address_column_name in props or not props[args.address_column_name]:
-            continue
-        address = props[args.address_column_name]
-        try:
-            number, street = split_address(address)
-        except CantParseAddressError:
-            continue
-
-        # Insert the coords into the dictionary.
-        latlon_point = (geojson_feature.geometry["coordinates"][1], geojson_feature.geometry["coordinates"][0])
-        try:
-            address_points[state][city][street][number] = latlon_point
-        except KeyError:
-            try:
-                address_points[state][city][street] = {number : latlon_point}
-            except KeyError:
-                try:
-                    address_points[state][city] = {street : {number : latlon_point}}
-                except KeyError:
-                    address_points[state] = {city : {street : {number : latlon_point}}}
+    for state, city, number_and_street, lat, lon in zip(states, cities, numbers_and_streets, lats, lons):
         # Log the status
         num_completed += 1
-        time_elapsed = int(time.time() - start_time)
-        print(get_time_estimate_string(time_elapsed, num_completed, num_points), end='\r')
-    print()
-
-    del(geojson_contents)
+        progress.update(num_completed)
+        if number_and_street == None:
+            continue
+        number, street = number_and_street
 
-    # Iterate over the CSV house sale rows and try to match them with address points.
-    unmatched_csv_rows = []
+        # Insert the coords into the dictionary.
+        address_points[(state, city, street, number)] = (lat, lon)
+    progress.finish(num_completed)
+
+    # Load the CSV house sale rows as text, so unmatched rows are written back unchanged.
+    print("Finding addresses for CSV rows.")
+    df = pd.read_csv(args.input_csv_path, dtype=str, keep_default_na=False, encoding="utf8")
+    if args.max_price:
+        df = df[df[args.price_column_name].astype(int) <= int(args.max_price)]
+
+    # Standardize and parse each column at once, then try to match each row with an address point.
+    if args.single_state:
+        states = [standardize_string(args.single_state)] * len(df)
+    else:
+        states = df[args.state_column_name].map(standardize_string)
+    cities = df[args.city_column_name].map(standardize_city)
+    numbers_and_roads = df[args.address_column_name].map(split_address)
+    latlon_points = [find_address_point(address_points, containing_towns, state, city, number_and_road) \
+            for state, city, number_and_road in zip(states, cities, numbers_and_roads)]
+    is_matched = np.array([latlon_point != None for latlon_point in latlon_points], dtype=bool)
+
+    matched_df = df[is_matched]
+    matched_points = [latlon_point for latlon_point in latlon_points if latlon_point != None]
     geojson_features = []
-    num_houses = num_rows_in_csv(args.input_csv_path)
-    fieldnames = []
-    with open(args.input_csv_path, 'r', encoding="utf8") as csvfile:
-        print("Finding addresses for CSV rows.")
-        num_completed = 0
-        start_time = time.time()
-        csv_reader = csv.DictReader(csvfile)
-        for row in csv_reader:
-            if not fieldnames:
-                fieldnames = list(row.keys())
-            if args.max_price and int(row[args.price_column_name]) > int(args.max_price):
-                continue
-            state = standardize_string(args.single_state) if args.single_state else standardize_string(row[args.state_column_name])
-            city = standardize_city(row[args.city_column_name])
-            try:
-                number, road = split_address(row[args.address_column_name])
-                found = False
-                try:
-                    lat, lon = address_points[state][city][road][number]
-                    found = True
-                except KeyError:
-                    if city in containing_towns:
-                        try:
-                            lat, lon = address_points[state][containing_towns[city]][road][number]
-                            found = True
-                        except KeyError:
-                            pass
-                if found:
-                    geojson_point = geojson.Point([lon, lat])
-                    props = {\
-                            args.city_column_name : row[args.city_column_name],\
-                            args.address_column_name : row[args.address_column_name],\
-                            args.price_column_name : int(row[args.price_column_name]),\
-                            args.date_column_name : row[args.date_column_name],\
-                            args.school_column_name : row[args.school_column_name]\
-                            }
-                    feature = geojson.Feature(geometry=geojson_point, properties=props)
-                    geojson_features.append(feature)
-                else:
-                    unmatched_csv_rows.append(row)
-
-            except CantParseAddressError:
-                unmatched_csv_rows.append(row)
-            # Log the status
-            num_completed += 1
-            time_elapsed = int(time.time() - start_time)
-            print(get_time_estimate_string(time_elapsed, num_completed, num_houses), end='\r')
-        print()
+    for (lat, lon), city, address, price, date, school in zip(matched_points,\
+            matched_df[args.city_column_name],\
+            matched_df[args.address_column_name],\
+            matched_df[args.price_column_name].astype(int).tolist(),\
+            matched_df[args.date_column_name],\
+            matched_df[args.school_column_name]):
+        props = {\
+                args.city_column_name : city,\
+                args.address_column_name : address,\
+                args.price_column_name : price,\
+                args.date_column_name : date,\
+                args.school_column_name : school\
+                }
+        geojson_features.append({"type": "Feature", "geometry": {"type": "Point", "coordinates": [lon, lat]}, "properties": props})
 
     print("Found addresses for %d houses." % (len(geojson_features)))
-    dump = geojson.dumps(geojson.FeatureCollection(features=geojson_features))
-    f = open(args.output_geojson_path, 'w')
-    f.write(dump)
+    f = open(args.output_geojson_path, 'wb')
+    f.write(orjson.dumps({"type": "FeatureCollection", "features": geojson_features}))
     f.close()
 
-    print("Did not find addresses for %d houses." % (len(unmatched_csv_rows)))
+    unmatched_df = df[~is_matched]
+    print("Did not find addresses for %d houses." % (len(unmatched_df)))
     with open(args.unmatched_csv_path, 'w') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        for row in unmatched_csv_rows:
+        writer = csv.writer(csvfile)
+        for row in unmatched_df.itertuples(index=False, name=None):
             try:
                 writer.writerow(row)
             except UnicodeEncodeError:
@@ -6,7 +6,7 @@ import geojson
 import os
 import time
 
-from general_utility import standardize_string, get_time_estimate_string
+from general_utility import standardize_string, ProgressPrinter
 
 """
 OSM data often has a lot of non-useful tags that I consider to be clutter.
@@ -40,26 +40,25 @@ def main():
     # Iterate over every key in every feature to get a set of keys to remove.
     print("Compiling set of keys to remove")
     keys_to_remove = set()
-    start_time = time.time()
     num_points = len(geojson_contents['features'])
     num_completed = 0
+    progress = ProgressPrinter(num_points)
     for geojson_feature in geojson_contents['features']:
         for key in geojson_feature.properties:
             if not key in keys_to_keep:
                 keys_to_remove.add(key)
         # Log the status
         num_completed += 1
-        time_elapsed = int(time.time() - start_time)
-        print(get_time_estimate_string(time_elapsed, num_completed, num_points), end='\r')
-    print()
+        progress.update(num_completed)
+    progress.finish(num_completed)
 
     # Iterate over every feature and remove the keys we don't want.
     num_attributes_removed = 0
     num_null_removed = 0
     num_features = 0
-    start_time = time.time()
     num_points = len(geojson_contents['features'])
     num_completed = 0
+    progress = ProgressPrinter(num_points)
     print("Removing keys from features")
     for geojson_feature in geojson_contents['features']:
         num_features += 1
@@ -73,9 +72,8 @@ def main():
                 pass
         # Log the status
         num_completed += 1
-        time_elapsed = int(time.time() - start_time)
-        print(get_time_estimate_string(time_elapsed, num_completed, num_points), end='\r')
-    print()
+        progress.update(num_completed)
+    progress.finish(num_completed)
 
     output_geojson_path = args.output_geojson_path if args.output_geojson_path else args.input_geojson_path
     f = open(output_geojson_path, 'w', encoding="utf8")
@@ -2,11 +2,12 @@
 
 import argparse
 import geojson
+import numpy as np
 import os
+import shapely
 import time
 
-from general_utility import to_camel_case, get_time_estimate_string
-from geojson_utility import geojson_feature_to_shapely
+from general_utility import to_camel_case, ProgressPrinter
 
 def main():
     parser = argparse.ArgumentParser(description="Take a geojson file of points and split into a bunch of files based on another geojson of polygons.")
@@ -37,26 +38,31 @@ def main():
         os.mkdir(args.output_directory)
 
     print("Filtering %d points into %d polygons." % (len(geojson_points['features']), len(geojson_polygons['features'])))
+    point_coordinates = np.array([geojson_point.geometry["coordinates"][:2] for geojson_point in geojson_points['features']], dtype=float).reshape(-1, 2)
+    point_xs = point_coordinates[:, 0]
+    point_ys = point_coordinates[:, 1]
     num_skipped = 0
     num_written = 0
     num_completed = 0
-    start_time = time.time()
     num_polygons = len(geojson_polygons['features'])
+    progress = ProgressPrinter(num_polygons)
     for geojson_polygon in geojson_polygons['features']:
+        # Log the status. Skipped polygons count as completed too.
+        num_completed += 1
+        progress.update(num_completed)
+
         # Get the name of the region
-        if not args.name_key in geojson_polygons.properties:
+        if not args.name_key in geojson_polygon.properties:
             num_skipped += 1
             continue
         name = to_camel_case(geojson_polygon.properties[args.name_key], args.capitalize)
         filename = name + filename_suffix + ".geojson"
 
-        # Get the set of points within the region
-        points = []
-        shapely_polygon = geojson_feature_to_shapely(geojson_polygon.geometry)
-        for geojson_point in geojson_points['features']:
-            shapely_point = geojson_feature_to_shapely(geojson_point.geometry)
-            if shapely_polygon.contains(shapely_point):
-                points.append(geojson_point)
+        # Get the set of points within the region, testing all of them at once
+        shapely_polygon = shapely.geometry.shape(geojson_polygon.geometry)
+        shapely.prepare(shapely_polygon)
+        is_inside = shapely.contains_xy(shapely_polygon, point_xs, point_ys)
+        points = [geojson_points['features'][i] for i in np.flatnonzero(is_inside)]
 
         # Write the points to a new geojson file
         if args.make_sub_directories:
@@ -71,12 +77,7 @@ def main():
         f.write(dump)
         f.close()
         num_written += 1
-        
-        # Log the status
-        num_completed += 1
-        time_elapsed = int(time.time() - start_time)
-        print(get_time_estimate_string(time_elapsed, num_completed, num_polygons), end='\r')
-    print()
+    progress.finish(num_completed)
 
     print("Wrote %d geojson files. Skipped %d missing %s tag." % (num_written, num_skipped, args.name_key))
 
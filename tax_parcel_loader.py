@@ -5,87 +5,194 @@ The TaxParcelLoader will load tax parcels in a bbox by looking through
 a directory hierarchy of counties.
 """
 
+from concurrent.futures import ProcessPoolExecutor
 import geopandas
+from itertools import repeat
 import json
+import numpy as np
 import os
 import pandas as pd
+import pyogrio
 import shapely
 
-from general_utility import latlon_to_crs
+from general_utility import latlon_to_crs, standardize_county
+
+# Stored in the state directory. Maps each county directory to the bounds in its bbox
+# file, along with the file's modification time so that stale entries are detected.
+COUNTY_BOUNDS_CACHE_FILENAME = "county_bounds_cache.json"
+
+# General names of the columns that AttributeFilter compares against numbers
+NUMERIC_FILTER_KEYS = ("year_built", "sqft", "acres", "bedrooms", "bathrooms")
+
+def bounds_intersect(bounds1, bounds2):
+    min_x1, min_y1, max_x1, max_y1 = bounds1
+    min_x2, min_y2, max_x2, max_y2 = bounds2
+    return min_x1 <= max_x2 and min_x2 <= max_x1 and min_y1 <= max_y2 and min_y2 <= max_y1
+
+def sql_identifier(name):
+    return '"%s"' % (name.replace('"', '""'))
+
+def sql_literal(value):
+    if isinstance(value, str):
+        return "'%s'" % (value.replace("'", "''"))
+    return str(value)
 
 class AttributeFilter():
     def __init__(self, already_sfh, require_connected_water, require_connected_sewer, min_year_built, max_year_built, min_sqft, max_sqft, min_acres, max_acres, min_beds, min_baths, county, school_district, city, municipality, zip_code):
         self.dont_filter_to_sfh = already_sfh
         self.require_connected_water = require_connected_water
         self.require_connected_sewer = require_connected_sewer
-        self.min_year_built = min_year_built if min_year_built else 0
-        self.max_year_built = max_year_built if max_year_built else 9999
-        self.min_sqft = min_sqft if min_sqft else 0
-        self.max_sqft = max_sqft if max_sqft else 99999
-        self.min_acres = min_acres if min_acres else 0
-        self.max_acres = max_acres if max_acres else 99999
-        self.min_beds = min_beds if min_beds else 0
-        self.min_baths = min_baths if min_baths else 0
+        # The numeric bounds come in with their defaults already filled in by argparse.
+        self.min_year_built = min_year_built
+        self.max_year_built = max_year_built
+        self.min_sqft = min_sqft
+        self.max_sqft = max_sqft
+        self.min_acres = min_acres
+        self.max_acres = max_acres
+        self.min_beds = min_beds
+        self.min_baths = min_baths
         self.county = county
         self.school_district = school_district
         self.city = city
         self.municipality = municipality
         self.zip_code = zip_code
 
-    def apply_filter(self, gdf, general_name_to_specific_name):
-        property_type_key = general_name_to_specific_name["keys"]["property_type"]
-        city_key = general_name_to_specific_name["keys"]["city"]
-        municipality_key = general_name_to_specific_name["keys"]["municipality"]
-        zip_code_key = general_name_to_specific_name["keys"]["zip_code"]
-        year_built_key = general_name_to_specific_name["keys"]["year_built"]
-        sqft_key = general_name_to_specific_name["keys"]["sqft"]
-        acres_key = general_name_to_specific_name["keys"]["acres"]
-        beds_key = general_name_to_specific_name["keys"]["bedrooms"]
-        baths_key = general_name_to_specific_name["keys"]["bathrooms"]
-        school_district_key = general_name_to_specific_name["keys"]["school_district"]
-        water_key = general_name_to_specific_name["keys"]["water_type"]
-        sewer_key = general_name_to_specific_name["keys"]["sewer_type"]
-        single_family_home_value = general_name_to_specific_name["values"]["single_family_home"]
-        connected_water_value = general_name_to_specific_name["values"]["connected_water"]
-        connected_sewer_value = general_name_to_specific_name["values"]["connected_sewer"]
-
+    def get_where_clause(self, general_name_to_specific_name, column_dtypes):
+        """
+        Build an OGR SQL WHERE clause for the filters so that the driver
+        can skip those features at read time. apply_filter is still needed
+        afterwards, but it will have much less to do.
+        column_dtypes maps each field in the file to its numpy dtype name. OGR
+        rejects comparing a text field to a number, so numeric comparisons are
+        only pushed down for numeric fields and the rest are left to apply_filter.
+        """
+        keys = general_name_to_specific_name["keys"]
+        values = general_name_to_specific_name["values"]
+        numeric_columns = set(column for column, dtype in column_dtypes.items() if np.issubdtype(np.dtype(dtype), np.number))
+        # (column, condition) pairs for comparisons against text, then against numbers
+        text_conditions = []
+        numeric_conditions = []
         if not self.dont_filter_to_sfh:
-            gdf = gdf[gdf[property_type_key] == single_family_home_value]
+            text_conditions.append((keys["property_type"], "= %s" % (sql_literal(values["single_family_home"]))))
+        numeric_conditions.append((keys["year_built"], "BETWEEN %s AND %s" % (sql_literal(self.min_year_built), sql_literal(self.max_year_built))))
+        numeric_conditions.append((keys["sqft"], "BETWEEN %s AND %s" % (sql_literal(self.min_sqft), sql_literal(self.max_sqft))))
+        numeric_conditions.append((keys["acres"], "BETWEEN %s AND %s" % (sql_literal(self.min_acres), sql_literal(self.max_acres))))
+        if self.min_beds:
+            numeric_conditions.append((keys["bedrooms"], ">= %s" % (sql_literal(self.min_beds))))
+        if self.min_baths:
+            numeric_conditions.append((keys["bathrooms"], ">= %s" % (sql_literal(self.min_baths))))
+        if self.require_connected_water:
+            text_conditions.append((keys["water_type"], "= %s" % (sql_literal(values["connected_water"]))))
+        if self.require_connected_sewer:
+            text_conditions.append((keys["sewer_type"], "= %s" % (sql_literal(values["connected_sewer"]))))
+        if self.city:
+            text_conditions.append((keys["city"], "= %s" % (sql_literal(self.city))))
+        if self.municipality:
+            text_conditions.append((keys["municipality"], "= %s" % (sql_literal(self.municipality))))
+        if self.zip_code:
+            text_conditions.append((keys["zip_code"], "= %s" % (sql_literal(self.zip_code))))
+        if self.school_district:
+            text_conditions.append((keys["school_district"], "= %s" % (sql_literal(self.school_district))))
 
-        if self.min_year_built or self.max_year_built:
-            gdf = gdf[(gdf[year_built_key] >= self.min_year_built) & (gdf[year_built_key] <= self.max_year_built)]
+        # OGR also rejects fields that aren't in the file at all.
+        conditions = ["%s %s" % (sql_identifier(column), condition) for column, condition in text_conditions if column in column_dtypes]
+        conditions += ["%s %s" % (sql_identifier(column), condition) for column, condition in numeric_conditions if column in numeric_columns]
+        return " AND ".join(conditions)
 
-        if self.min_sqft or self.max_sqft:
-            gdf = gdf[(gdf[sqft_key] >= self.min_sqft) & (gdf[sqft_key] <= self.max_sqft)]
+    def apply_filter(self, gdf, general_name_to_specific_name):
+        keys = general_name_to_specific_name["keys"]
+        values = general_name_to_specific_name["values"]
+        property_type_key = keys["property_type"]
+        city_key = keys["city"]
+        municipality_key = keys["municipality"]
+        zip_code_key = keys["zip_code"]
+        year_built_key = keys["year_built"]
+        sqft_key = keys["sqft"]
+        acres_key = keys["acres"]
+        beds_key = keys["bedrooms"]
+        baths_key = keys["bathrooms"]
+        school_district_key = keys["school_district"]
+        water_key = keys["water_type"]
+        sewer_key = keys["sewer_type"]
+        single_family_home_value = values["single_family_home"]
+        connected_water_value = values["connected_water"]
+        connected_sewer_value = values["connected_sewer"]
 
-        if self.min_acres or self.max_acres:
-            gdf = gdf[(gdf[acres_key] >= self.min_acres) & (gdf[acres_key] <= self.max_acres)]
+        # Collect every condition as a plain boolean array and combine them at the end,
+        # so the dataframe is only sliced once and no index alignment happens in between.
+        conditions = []
+
+        if not self.dont_filter_to_sfh:
+            conditions.append((gdf[property_type_key] == single_family_home_value).to_numpy(dtype=bool, na_value=False))
+
+        conditions.append(gdf[year_built_key].between(self.min_year_built, self.max_year_built).to_numpy(dtype=bool, na_value=False))
+        conditions.append(gdf[sqft_key].between(self.min_sqft, self.max_sqft).to_numpy(dtype=bool, na_value=False))
+        conditions.append(gdf[acres_key].between(self.min_acres, self.max_acres).to_numpy(dtype=bool, na_value=False))
 
         if self.min_beds:
-            gdf = gdf[(gdf[beds_key] >= self.min_beds)]
+            conditions.append((gdf[beds_key] >= self.min_beds).to_numpy(dtype=bool, na_value=False))
 
         if self.min_baths:
-            gdf = gdf[(gdf[baths_key] >= self.min_baths)]
+            conditions.append((gdf[baths_key] >= self.min_baths).to_numpy(dtype=bool, na_value=False))
 
         if self.require_connected_water:
-            gdf = gdf[(gdf[water_key] == connected_water_value)]
+            conditions.append((gdf[water_key] == connected_water_value).to_numpy(dtype=bool, na_value=False))
 
         if self.require_connected_sewer:
-            gdf = gdf[(gdf[sewer_key] == connected_sewer_value)]
+            conditions.append((gdf[sewer_key] == connected_sewer_value).to_numpy(dtype=bool, na_value=False))
 
         if self.city:
-            gdf = gdf[gdf[city_key] == self.city]
+            conditions.append((gdf[city_key] == self.city).to_numpy(dtype=bool, na_value=False))
 
         if self.municipality:
-            gdf = gdf[gdf[municipality_key] == self.municipality]
+            conditions.append((gdf[municipality_key] == self.municipality).to_numpy(dtype=bool, na_value=False))
 
         if self.zip_code:
-            gdf = gdf[gdf[zip_code_key] == self.zip_code]
+            conditions.append((gdf[zip_code_key] == self.zip_code).to_numpy(dtype=bool, na_value=False))
 
         if self.school_district:
-            gdf = gdf[gdf[school_district_key] == self.school_district]
+            conditions.append((gdf[school_district_key] == self.school_district).to_numpy(dtype=bool, na_value=False))
+
+        mask = np.logical_and.reduce(conditions)
+        return gdf.iloc[np.flatnonzero(mask)]
+
+def load_county_parcels(parcels_filepath, general_name_to_specific_name, requested_bbox, attribute_filter):
+    """
+    Load the parcels from a single county file that are within the requested bbox
+    and pass the filter, with the columns renamed to the general names. This is a
+    module-level function so that it can be run in a worker process.
+    """
+    # Load the parcels that are within the requested bounds. Only the columns named in
+    # the keys file are read, since every other column gets dropped at the end anyway.
+    keys = general_name_to_specific_name['keys']
+    info = pyogrio.read_info(parcels_filepath)
+    column_dtypes = dict(zip(info['fields'], info['dtypes']))
+    where_clause = attribute_filter.get_where_clause(general_name_to_specific_name, column_dtypes)
+    needed_columns = list(keys.values())
+    gdf = geopandas.read_file(parcels_filepath, bbox=requested_bbox, where=where_clause, columns=needed_columns, engine='pyogrio')
 
-        return gdf
+    # Some files store numbers as text. Their ranges were not part of the WHERE clause,
+    # so convert those columns here and let apply_filter compare them as numbers.
+    # Values that aren't numbers become NaN and never pass a range check.
+    for general_name in NUMERIC_FILTER_KEYS:
+        column = keys[general_name]
+        if not pd.api.types.is_numeric_dtype(gdf[column]):
+            gdf[column] = pd.to_numeric(gdf[column], errors='coerce')
+
+    # Filter the data
+    gdf = attribute_filter.apply_filter(gdf, general_name_to_specific_name)
+
+    # Remove unwanted columns and rename the rest.
+    gdf = gdf.rename(columns={value: key for key, value in keys.items()})
+    desired_keys = list(keys.keys()) + ['geometry']
+    gdf = gdf[desired_keys]
+    gdf = gdf.round(2)
+
+    # Only the parcels that survived filtering get reprojected, and only if they
+    # aren't already in EPSG 3857.
+    if len(gdf) != 0 and gdf.crs != "EPSG:3857":
+        gdf = gdf.to_crs("EPSG:3857")
+    return gdf
 
 class TaxParcelLoader():
     def __init__(self, state_dir, keys_and_values_filename):
@@ -93,6 +200,24 @@ class TaxParcelLoader():
         self.state_dir = state_dir
         self.keys_and_values_filename = keys_and_values_filename
 
+    def load_county_bounds_cache(self):
+        cache_filepath = os.path.join(self.state_dir, COUNTY_BOUNDS_CACHE_FILENAME)
+        if not os.path.exists(cache_filepath):
+            return {}
+        f = open(cache_filepath, 'r')
+        county_bounds_cache = json.loads(f.read())
+        f.close()
+        return county_bounds_cache
+
+    def save_county_bounds_cache(self, county_bounds_cache):
+        cache_filepath = os.path.join(self.state_dir, COUNTY_BOUNDS_CACHE_FILENAME)
+        try:
+            f = open(cache_filepath, 'w')
+            f.write(json.dumps(county_bounds_cache))
+            f.close()
+        except OSError:
+            print("Could not write %s." % (cache_filepath))
+
     def load_parcels(self, center_latlon, width_meters, height_meters, attribute_filter):
         # Get the requested bounding box in the EPSG 3857 projection.
         x, y = latlon_to_crs(center_latlon[0], center_latlon[1], 3857)
@@ -104,37 +229,48 @@ class TaxParcelLoader():
                     (x - width_meters/2, y + height_meters/2),\
                     (x - width_meters/2, y - height_meters/2)))\
                     ], crs="EPSG:3857")
+        requested_bounds = (x - width_meters/2, y - height_meters/2, x + width_meters/2, y + height_meters/2)
 
         # First load the keys/values for the state. Most counties will use this.
         f = open(os.path.join(self.state_dir, self.keys_and_values_filename), 'r')
         statewide_general_name_to_specific_name = json.loads(f.read())
         f.close()
 
-        # Start with an empty dataframe to add things to.
-        combined_gdf = geopandas.GeoDataFrame()
+        # Standardize the requested county once rather than for every directory.
+        requested_county = standardize_county(attribute_filter.county) if attribute_filter.county else None
+
+        # The county bboxes rarely change, so their bounds are cached rather than
+        # opening every bbox file on every run.
+        county_bounds_cache = self.load_county_bounds_cache()
+        county_bounds_cache_changed = False
 
-        # Iterate over each "...County" directory
+        # Iterate over each "...County" directory to find the files that need loading.
+        county_names = []
+        parcels_filepaths = []
+        county_general_names_to_specific_names = []
         for entry in os.listdir(self.state_dir):
             full_path = os.path.join(self.state_dir, entry)
             if entry.endswith("County") and os.path.isdir(full_path):
-                if attribute_filter.county and standardize_county(attribute_filter.county) != standardize_county(entry[:-len("County")]):
+                if requested_county and requested_county != standardize_county(entry[:-len("County")]):
                     # If restricting to a single county, don't even try any others.
                     continue
                 # Load the county's bbox and check if it is sufficiently close to the requested bbox.
                 bbox_filepath = os.path.join(self.state_dir, entry, entry + "Bbox.geojson")
                 if not os.path.exists(bbox_filepath):
                     raise ValueError("%s does not exist." % (bbox_filepath))
-                county_bbox = geopandas.GeoSeries.from_file(bbox_filepath)
-                if not county_bbox[0].intersects(requested_bbox[0]):
+                bbox_mtime = os.stat(bbox_filepath).st_mtime
+                if entry in county_bounds_cache and county_bounds_cache[entry]["mtime"] == bbox_mtime:
+                    county_bounds = county_bounds_cache[entry]["bounds"]
+                else:
+                    county_bounds = geopandas.GeoSeries.from_file(bbox_filepath)[0].bounds
+                    county_bounds_cache[entry] = {"mtime" : bbox_mtime, "bounds" : list(county_bounds)}
+                    county_bounds_cache_changed = True
+                if not bounds_intersect(county_bounds, requested_bounds):
                     continue
 
-                # Load the parcels that are within the requested bounds.
                 parcels_filepath = os.path.join(self.state_dir, entry, entry[:-len("County")] + "TaxParcelCentroids.geojson")
                 if not os.path.exists(parcels_filepath):
                     raise ValueError("%s does not exist." % (parcels_filepath))
-                gdf = geopandas.read_file(parcels_filepath, bbox=requested_bbox, engine='fiona')
-
-                # Filter the data
                 county_keys_and_values_filepath = os.path.join(full_path, self.keys_and_values_filename)
                 if os.path.exists(county_keys_and_values_filepath):
                     f = open(county_keys_and_values_filepath, 'r')
@@ -143,16 +279,29 @@ class TaxParcelLoader():
                 else:
                     county_general_name_to_specific_name = statewide_general_name_to_specific_name
 
-                gdf = attribute_filter.apply_filter(gdf, county_general_name_to_specific_name)
+                county_names.append(entry)
+                parcels_filepaths.append(parcels_filepath)
+                county_general_names_to_specific_names.append(county_general_name_to_specific_name)
 
-                # Remove unwanted columns and rename the rest.
-                gdf = gdf.rename(columns={value: key for key, value in county_general_name_to_specific_name['keys'].items()})
-                desired_keys = list(county_general_name_to_specific_name['keys'].keys()) + ['geometry']
-                gdf = gdf[desired_keys]
-                gdf = gdf.round(2)
+        if county_bounds_cache_changed:
+            self.save_county_bounds_cache(county_bounds_cache)
 
-                # Add the parcels to the existing dataframe.
-                if len(gdf) != 0:
-                    combined_gdf = pd.concat([combined_gdf, gdf])
-                print("%d in %s" % (len(gdf), entry))
-        return combined_gdf.to_crs("EPSG:3857")
+        # The county files are independent, so load them in parallel. A single county
+        # (the usual case with --county) is loaded here, since starting worker processes
+        # and pickling the result back would only add time.
+        if len(parcels_filepaths) <= 1:
+            county_gdfs = [load_county_parcels(parcels_filepath, county_general_name_to_specific_name, requested_bbox, attribute_filter)\
+                    for parcels_filepath, county_general_name_to_specific_name in zip(parcels_filepaths, county_general_names_to_specific_names)]
+        else:
+            with ProcessPoolExecutor(max_workers=min(len(parcels_filepaths), os.cpu_count() or 1)) as executor:
+                county_gdfs = list(executor.map(load_county_parcels, parcels_filepaths, county_general_names_to_specific_names,\
+                        repeat(requested_bbox), repeat(attribute_filter)))
+
+        # Start with an empty dataframe to add things to.
+        combined_gdf = geopandas.GeoDataFrame(geometry=[], crs="EPSG:3857")
+        for entry, gdf in zip(county_names, county_gdfs):
+            print("%d in %s" % (len(gdf), entry))
+        nonempty_gdfs = [gdf for gdf in county_gdfs if len(gdf) != 0]
+        if nonempty_gdfs:
+            combined_gdf = pd.concat([combined_gdf] + nonempty_gdfs)
+        return combined_gdf